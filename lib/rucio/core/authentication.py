@@ -14,6 +14,7 @@
 
 import datetime
 import hashlib
+import hmac
 import random
 import re
 import sys
@@ -127,9 +128,11 @@ def get_auth_token_user_pass(
 
     db_salt = result['salt']
     db_password = result['password']
+    if db_salt is None or db_password is None:      # no password set, so nothing can match it
+        return None
 
     salted_password = db_salt + password.encode()
-    if db_password != hashlib.sha256(salted_password).hexdigest():
+    if not hmac.compare_digest(db_password.encode(), hashlib.sha256(salted_password).hexdigest().encode()):
         return None
 
     # get account identifier
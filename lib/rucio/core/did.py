@@ -2359,8 +2359,7 @@ def set_dids_metadata_bulk(
     :param session: The database session in use.
     """
 
-    for did in dids:
-        did_meta_plugins.set_metadata_bulk(scope=did['scope'], name=did['name'], meta=did['meta'], recursive=recursive, session=session)
+    did_meta_plugins.set_dids_metadata_bulk(dids=dids, recursive=recursive, session=session)
 
 
 @read_session
@@ -2635,7 +2634,7 @@ def list_dids(
     offset: Optional[int] = None,
     long: bool = False,
     recursive: bool = False,
-    ignore_dids: Optional["Sequence[str]"] = None,
+    ignore_dids: Optional["set[tuple[InternalScope, str]]"] = None,
     *,
     session: "Session"
 ) -> "Iterator[dict[str, Any]]":
@@ -2650,7 +2649,7 @@ def list_dids(
     :param offset: offset number.
     :param long: Long format option to display more information for each DID.
     :param recursive: Recursively list DIDs content.
-    :param ignore_dids: List of DIDs to refrain from yielding.
+    :param ignore_dids: Set of (scope, name) tuples of DIDs to refrain from yielding.
     :param session: The database session in use.
     """
     return did_meta_plugins.list_dids(scope, filters, did_type, ignore_case, limit, offset, long, recursive, ignore_dids, session=session)
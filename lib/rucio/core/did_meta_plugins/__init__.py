@@ -132,52 +132,85 @@ def set_metadata(scope, name, key, value, recursive=False, *, session: "Session"
         raise exception.InvalidMetadata('No plugin manages metadata key %s for DID %s:%s' % (key, scope, name))
 
 
-@transactional_session
-def set_metadata_bulk(scope, name, meta, recursive=False, *, session: "Session"):
+def _metadata_by_plugin(scope, name, metadata, key_plugins, *, session: "Session"):
     """
-    Bulk sets metadata for a given did.
+    Splits the metadata of a did into the key-values managed by each plugin.
 
     :param scope: The scope name.
     :param name: The data identifier name.
-    :param meta: The key-value mapping of metadata to set.
-    :param recursive: (optional) Propagate the metadata change recursively to content.
-    :param session: (optional) The database session in use.
+    :param metadata: The key-value mapping of metadata to set.
+    :param key_plugins: Cache of the plugin managing each key, filled in as keys are resolved.
+    :param session: The database session in use.
+    :returns: Dictionary of plugin: key-value mapping, for the plugins managing at least one key.
     :raises: InvalidMetadata
     """
-    metadata = meta
-
     unmanaged_keys = list()
     if not isinstance(metadata, dict):
         metadata = dict(metadata)
-    metadata_plugin_keys = {metadata_plugin: [] for metadata_plugin in METADATA_PLUGIN_MODULES}
+    plugin_metadata = {}
 
     # Iterate through all keys, sequentially checking if each metadata plugin manages the considered key. If it
-    # does, add it to the list in the plugin's entry in {metadata_plugin_keys}. Note that the order of
+    # does, add the key-value to the plugin's entry in {plugin_metadata}. Note that the order of
     # [METADATA_PLUGIN_MODULES] means that the key is always checked for existence in the base list first.
-    for key in metadata.keys():
-        # Check for forbidden characters in key.
-        for char in RESTRICTED_CHARACTERS:
-            if char in key:
-                raise exception.InvalidMetadata('Restricted character "{}" found in metadata key. Reason: {}'.format(
-                    char,
-                    RESTRICTED_CHARACTERS[char]
-                ))
-        metadata_is_included = False
-        for metadata_plugin in METADATA_PLUGIN_MODULES:
-            if metadata_plugin.manages_key(key, session=session):
-                metadata_plugin_keys[metadata_plugin].append(key)
-                metadata_is_included = True
-                break
-        if not metadata_is_included:
+    for key, value in metadata.items():
+        if key not in key_plugins:
+            # Check for forbidden characters in key.
+            for char in RESTRICTED_CHARACTERS:
+                if char in key:
+                    raise exception.InvalidMetadata('Restricted character "{}" found in metadata key. Reason: {}'.format(
+                        char,
+                        RESTRICTED_CHARACTERS[char]
+                    ))
+            key_plugins[key] = None
+            for metadata_plugin in METADATA_PLUGIN_MODULES:
+                if metadata_plugin.manages_key(key, session=session):
+                    key_plugins[key] = metadata_plugin
+                    break
+        if key_plugins[key] is None:
             unmanaged_keys.append(key)
+        else:
+            plugin_metadata.setdefault(key_plugins[key], {})[key] = value
     if unmanaged_keys:
         raise exception.InvalidMetadata('No plugin manages metadata keys %s on DID %s:%s' % (unmanaged_keys, scope, name))
+    return plugin_metadata
+
+
+@transactional_session
+def set_metadata_bulk(scope, name, meta, recursive=False, *, session: "Session"):
+    """
+    Bulk sets metadata for a given did.
 
+    :param scope: The scope name.
+    :param name: The data identifier name.
+    :param meta: The key-value mapping of metadata to set.
+    :param recursive: (optional) Propagate the metadata change recursively to content.
+    :param session: (optional) The database session in use.
+    :raises: InvalidMetadata
+    """
     # For each plugin, set the metadata.
-    for metadata_plugin, keys_managed_by_this_plugin in metadata_plugin_keys.items():
-        if keys_managed_by_this_plugin:
-            this_plugin_metadata = {key: metadata[key] for key in keys_managed_by_this_plugin}
-            metadata_plugin.set_metadata_bulk(scope, name, metadata=this_plugin_metadata, recursive=recursive, session=session)
+    for metadata_plugin, this_plugin_metadata in _metadata_by_plugin(scope, name, meta, {}, session=session).items():
+        metadata_plugin.set_metadata_bulk(scope, name, metadata=this_plugin_metadata, recursive=recursive, session=session)
+
+
+@transactional_session
+def set_dids_metadata_bulk(dids, recursive=False, *, session: "Session"):
+    """
+    Bulk sets metadata for a list of dids, handing each plugin all of its dids at once.
+
+    :param dids: A list of dids, each a dictionary with the keys scope, name and meta.
+    :param recursive: (optional) Propagate the metadata change recursively to content.
+    :param session: (optional) The database session in use.
+    :raises: InvalidMetadata
+    """
+    key_plugins = {}
+    plugin_dids = {}
+    for did in dids:
+        for metadata_plugin, this_plugin_metadata in _metadata_by_plugin(did['scope'], did['name'], did['meta'], key_plugins, session=session).items():
+            plugin_dids.setdefault(metadata_plugin, []).append({'scope': did['scope'], 'name': did['name'], 'meta': this_plugin_metadata})
+
+    # For each plugin, set the metadata of all its dids.
+    for metadata_plugin, this_plugin_dids in plugin_dids.items():
+        metadata_plugin.set_dids_metadata_bulk(this_plugin_dids, recursive=recursive, session=session)
 
 
 @transactional_session
@@ -210,7 +243,7 @@ def list_dids(scope=None, filters=None, did_type='collection', ignore_case=False
     :param offset: offset number.
     :param long: Long format option to display more information for each DID.
     :param recursive: Recursively list DIDs content.
-    :param ignore_dids: List of DIDs to refrain from yielding.
+    :param ignore_dids: Set of (scope, name) tuples of DIDs to refrain from yielding.
     :param session: The database session in use.
     :returns: List of dids satisfying metadata criteria.
     :raises: InvalidMetadata
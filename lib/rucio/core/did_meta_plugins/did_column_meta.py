@@ -16,14 +16,14 @@ import operator
 from datetime import datetime, timedelta
 from typing import TYPE_CHECKING
 
-from sqlalchemy import inspect, update
+from sqlalchemy import and_, bindparam, inspect, select, update
 from sqlalchemy.exc import CompileError, InvalidRequestError, NoResultFound
 from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import true
 
 from rucio.common import exception
 from rucio.core import account_counter, rse_counter
-from rucio.core.did_meta_plugins.did_meta_plugin_interface import DidMetaPlugin
+from rucio.core.did_meta_plugins.did_meta_plugin_interface import COLLECTION_TYPES, DID_SCOPE_QUERY, STREAM_BATCH_SIZE, DidMetaPlugin
 from rucio.core.did_meta_plugins.filter_engine import FilterEngine
 from rucio.db.sqla import models
 from rucio.db.sqla.constants import DIDType
@@ -34,6 +34,15 @@ if TYPE_CHECKING:
 
     from sqlalchemy.orm import Session
 
+# Did lookup, built once and executed with the did bound as the scope and name parameters
+_DID_ROW = select(
+    models.DataIdentifier
+).with_hint(
+    models.DataIdentifier, "INDEX(DIDS DIDS_PK)", 'oracle'
+).where(
+    and_(models.DataIdentifier.scope == bindparam('scope'), models.DataIdentifier.name == bindparam('name'))
+)
+
 
 class DidColumnMeta(DidMetaPlugin):
     """
@@ -53,8 +62,7 @@ class DidColumnMeta(DidMetaPlugin):
         :param session: The database session in use.
         """
         try:
-            row = session.query(models.DataIdentifier).filter_by(scope=scope, name=name).\
-                with_hint(models.DataIdentifier, "INDEX(DIDS DIDS_PK)", 'oracle').one()
+            row = session.execute(_DID_ROW, {'scope': scope, 'name': name}).scalar_one()
             return row.to_dict()
         except NoResultFound:
             raise exception.DataIdentifierNotFound(f"Data identifier '{scope}:{name}' not found")
@@ -66,7 +74,8 @@ class DidColumnMeta(DidMetaPlugin):
     @transactional_session
     def set_metadata_bulk(self, scope, name, metadata, recursive=False, *, session: "Session"):
         did_query = session.query(models.DataIdentifier).with_hint(models.DataIdentifier, "INDEX(DIDS DIDS_PK)", 'oracle').filter_by(scope=scope, name=name)
-        if did_query.one_or_none() is None:
+        # only probe the primary key, rather than loading the whole row
+        if session.scalar(DID_SCOPE_QUERY, {'scope': scope, 'name': name}) is None:
             raise exception.DataIdentifierNotFound("Data identifier '%s:%s' not found" % (scope, name))
 
         remainder = {}
@@ -183,9 +192,11 @@ class DidColumnMeta(DidMetaPlugin):
         :param long: Long format option to display more information for each DID.
         :param session: The database session in use.
         :param recursive: Recursively list DIDs content.
-        :param ignore_dids: List of DIDs to refrain from yielding.
+        :param ignore_dids: Set of (scope, name) tuples of DIDs to refrain from yielding.
         """
-        if not ignore_dids:
+        # a single query never returns a DID twice, so only the recursion needs to track the yielded DIDs.
+        # An empty set passed down the recursion must still be shared.
+        if ignore_dids is None and recursive:
             ignore_dids = set()
 
         # mapping for semantic <type> to a (set of) recognised DIDType(s).
@@ -205,6 +216,7 @@ class DidColumnMeta(DidMetaPlugin):
         # if type maps to many DIDTypes, the corresponding or_group will be copied the required number of times to satisfy all the logical possibilities.
         filters_tmp = []
         for or_group in filters:
+            or_group = or_group.copy()                  # leave the caller's filters untouched
             if 'type' not in or_group:
                 or_group_type = did_type.lower()
             else:
@@ -241,35 +253,33 @@ class DidColumnMeta(DidMetaPlugin):
 
             # Get attached DIDs and save in list because query has to be finished before starting a new one in the recursion
             collections_content = []
-            for did in query.yield_per(100):
-                if (did.did_type == DIDType.CONTAINER or did.did_type == DIDType.DATASET):
+            for did in query.yield_per(STREAM_BATCH_SIZE):
+                if did.did_type in COLLECTION_TYPES:
                     collections_content += [d for d in list_content(scope=did.scope, name=did.name)]
 
-            # Replace any name filtering with recursed DID names.
+            # Replace any name filtering with recursed DID names, on copies shared by no other recursion.
             for did in collections_content:
-                for or_group in filters:
-                    or_group['name'] = did['name']
-                for result in self.list_dids(scope=did['scope'], filters=filters, recursive=True, did_type=did_type, limit=limit, offset=offset,
+                content_filters = [dict(or_group, name=did['name']) for or_group in filters]
+                for result in self.list_dids(scope=did['scope'], filters=content_filters, recursive=True, did_type=did_type, limit=limit, offset=offset,
                                              long=long, ignore_dids=ignore_dids, session=session):
                     yield result
 
-        for did in query.yield_per(5):                  # don't unpack this as it makes it dependent on query return order!
+        for did in query.yield_per(STREAM_BATCH_SIZE):                  # don't unpack this as it makes it dependent on query return order!
+            if ignore_dids is not None:
+                did_full = (did.scope, did.name)
+                if did_full in ignore_dids:             # the recursion may reach a DID more than once
+                    continue
+                ignore_dids.add(did_full)
             if long:
-                did_full = "{}:{}".format(did.scope, did.name)
-                if did_full not in ignore_dids:         # concatenating results of OR clauses may contain duplicate DIDs if query result sets not mutually exclusive.
-                    ignore_dids.add(did_full)
-                    yield {
-                        'scope': did.scope,
-                        'name': did.name,
-                        'did_type': str(did.did_type),
-                        'bytes': did.bytes,
-                        'length': did.length
-                    }
+                yield {
+                    'scope': did.scope,
+                    'name': did.name,
+                    'did_type': str(did.did_type),
+                    'bytes': did.bytes,
+                    'length': did.length
+                }
             else:
-                did_full = "{}:{}".format(did.scope, did.name)
-                if did_full not in ignore_dids:         # concatenating results of OR clauses may contain duplicate DIDs if query result sets not mutually exclusive.
-                    ignore_dids.add(did_full)
-                    yield did.name
+                yield did.name
 
     def delete_metadata(self, scope, name, key, *, session: "Optional[Session]" = None):
         """
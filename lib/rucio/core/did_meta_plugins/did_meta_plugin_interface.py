@@ -15,16 +15,42 @@
 from abc import ABCMeta, abstractmethod
 from typing import TYPE_CHECKING, Literal
 
+from sqlalchemy import and_, bindparam, select
+
+from rucio.db.sqla import models
+from rucio.db.sqla.constants import DIDType
 from rucio.db.sqla.session import transactional_session
 
 if TYPE_CHECKING:
-    from collections.abc import Iterator
+    from collections.abc import Iterable, Iterator, Mapping
     from typing import Any, Optional, Union
 
     from sqlalchemy.orm import Session
 
     from rucio.common.types import InternalScope
 
+# Number of rows fetched per round trip when streaming list_dids results
+STREAM_BATCH_SIZE = 1000
+
+# Types of the dids that list_dids recurses into
+COLLECTION_TYPES = (DIDType.CONTAINER, DIDType.DATASET)
+
+# Long format of a listed did, for the plugins which only know its scope and name. Copied per did.
+LONG_DID_TEMPLATE = {
+    'scope': None,
+    'name': None,
+    'did_type': None,
+    'bytes': None,
+    'length': None
+}
+
+# Probe for a did, built once and executed with the did bound as the scope and name parameters
+DID_SCOPE_QUERY = select(
+    models.DataIdentifier.scope
+).where(
+    and_(models.DataIdentifier.scope == bindparam('scope'), models.DataIdentifier.name == bindparam('name'))
+)
+
 
 class DidMetaPlugin(metaclass=ABCMeta):
     """
@@ -101,6 +127,26 @@ class DidMetaPlugin(metaclass=ABCMeta):
         for key, value in meta.items():
             self.set_metadata(scope, name, key, value, recursive=recursive, session=session)
 
+    @transactional_session
+    def set_dids_metadata_bulk(
+        self,
+        dids: "Iterable[Mapping[str, Any]]",
+        recursive: bool = False,
+        *,
+        session: "Optional[Session]" = None
+    ) -> None:
+        """
+        Add metadata to a list of data identifiers in bulk.
+
+        Plugins able to write many dids at once should override this.
+
+        :param dids: A list of dids, each a dictionary with the keys scope, name and meta.
+        :param recursive: Option to propagate the metadata change to content.
+        :param session: The database session in use.
+        """
+        for did in dids:
+            self.set_metadata_bulk(did['scope'], did['name'], did['meta'], recursive=recursive, session=session)
+
     @abstractmethod
     def delete_metadata(
         self,
@@ -14,6 +14,7 @@
 
 import ast
 import fnmatch
+import json
 import operator
 from datetime import date, datetime, timedelta
 from importlib import import_module
@@ -415,6 +416,9 @@ class FilterEngine:
                                 expression = "({}->>'{}')::timestamp {} '{}'".format(jsonb_column, key, POSTGRES_OP_MAP[oper], value)
                             else:
                                 expression = "{}::timestamp {} '{}'".format(key, POSTGRES_OP_MAP[oper], value)
+                        elif isinstance(value, str) and oper == operator.eq and is_in_json_column:
+                            # containment (rather than ->> extraction) lets the planner use a GIN index on the jsonb column.
+                            expression = "{} @> '{}'".format(jsonb_column, json.dumps({key: value}).replace("'", "''"))
                         else:
                             if is_in_json_column:
                                 expression = "{}->>'{}' {} '{}'".format(jsonb_column, key, POSTGRES_OP_MAP[oper], value)
@@ -14,21 +14,123 @@
 
 import json as json_lib
 import operator
-from typing import TYPE_CHECKING, Any, cast
+from itertools import chain, islice
+from typing import TYPE_CHECKING, Any
 
+from sqlalchemy import Boolean, String, and_, bindparam, cast, exists, func, literal, literal_column, or_, select, true, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import DataError, NoResultFound
 
 from rucio.common import exception
-from rucio.core.did_meta_plugins.did_meta_plugin_interface import DidMetaPlugin
+from rucio.common.utils import chunks
+from rucio.core.did_meta_plugins.did_meta_plugin_interface import COLLECTION_TYPES, DID_SCOPE_QUERY, LONG_DID_TEMPLATE, STREAM_BATCH_SIZE, DidMetaPlugin
 from rucio.core.did_meta_plugins.filter_engine import FilterEngine
 from rucio.db.sqla import models
-from rucio.db.sqla.constants import DIDType
 from rucio.db.sqla.session import read_session, stream_session, transactional_session
 from rucio.db.sqla.util import json_implemented
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
     from sqlalchemy.orm import Session
 
+# Single-did lookups, built once and executed with the did bound as the scope and name parameters
+_DID_META_SCOPE = select(
+    models.DidMeta.scope
+).where(
+    and_(models.DidMeta.scope == bindparam('scope'), models.DidMeta.name == bindparam('name'))
+)
+_DID_META_META = select(
+    models.DidMeta.meta
+).where(
+    and_(models.DidMeta.scope == bindparam('scope'), models.DidMeta.name == bindparam('name'))
+)
+_DID_META_ROW = select(
+    models.DidMeta
+).where(
+    and_(models.DidMeta.scope == bindparam('scope'), models.DidMeta.name == bindparam('name'))
+)
+
+# (encode, decode) pair converting between a metadata dict and the value of the meta column, per dialect.
+# Oracle and sqlite back the column with a string type, so the blob is (de)serialised client-side. Otherwise
+# decoding copies the dict, so that a modified value compares unequal to the loaded one and is flushed.
+_NATIVE_JSON_CODEC = (lambda meta: meta, dict)
+_STRING_JSON_CODEC = (json_lib.dumps, json_lib.loads)
+_JSON_CODECS = {'oracle': _STRING_JSON_CODEC, 'sqlite': _STRING_JSON_CODEC}
+
+
+def _json_codec(session: "Session") -> tuple["Callable[[Any], Any]", "Callable[[Any], Any]"]:
+    return _JSON_CODECS.get(session.bind.dialect.name, _NATIVE_JSON_CODEC)
+
+
+def _on_conflict_merge(stmt):
+    """
+    Turns an insert of did_meta rows into a Postgres upsert merging their metadata into the stored objects.
+
+    Rows already holding all the given key-values are left untouched. A stored SQL or JSON null counts as an
+    empty object, which ``||`` would otherwise turn into NULL or an array respectively.
+
+    :param stmt: The Postgres insert statement.
+    """
+    stored_meta = func.coalesce(func.nullif(models.DidMeta.meta, literal_column("'null'::jsonb")), literal_column("'{}'::jsonb"))
+    merged_meta = stored_meta.op('||')(stmt.excluded.meta)
+    return stmt.on_conflict_do_update(
+        index_elements=[models.DidMeta.scope, models.DidMeta.name],
+        set_={'meta': merged_meta,
+              'updated_at': stmt.excluded.updated_at},
+        where=merged_meta.is_distinct_from(models.DidMeta.meta)
+    )
+
+
+# Postgres upserts, built once and executed with the scope, name and meta parameters of the rows, as plain statements
+# rather than ORM bulk inserts. _MERGE_UPSERT creates the rows if needed. _MERGE_UPSERT_IF_DID_EXISTS only writes the
+# row of an existing did, and returns its scope, so no row means that either the did does not exist or it already
+# holds all the key-values.
+_MERGE_UPSERT = _on_conflict_merge(
+    pg_insert(models.DidMeta)
+).execution_options(
+    dml_strategy='raw'
+)
+_MERGE_UPSERT_IF_DID_EXISTS = _on_conflict_merge(
+    pg_insert(models.DidMeta).from_select(
+        ['scope', 'name', 'meta'],
+        select(
+            bindparam('scope', type_=models.DidMeta.scope.type),
+            bindparam('name', type_=models.DidMeta.name.type),
+            cast(bindparam('meta', type_=models.DidMeta.meta.type), models.DidMeta.meta.type)
+        ).where(
+            exists().where(and_(models.DataIdentifier.scope == bindparam('scope'),
+                                models.DataIdentifier.name == bindparam('name')))
+        )
+    )
+).returning(
+    models.DidMeta.scope
+).execution_options(
+    dml_strategy='raw'
+)
+
+
+def _merged_meta(stored_meta, metadata, codec):
+    """
+    Returns the stored metadata updated with the given key-values, in the form assigned to the meta column.
+
+    :param stored_meta: The current value of the meta column.
+    :param metadata: The key-values to set.
+    :param codec: The (encode, decode) pair of the dialect in use.
+    :returns: The new value of the meta column, or None if the stored metadata already holds all key-values.
+    """
+    encode, decode = codec
+    # a stored SQL or JSON null counts as an empty object
+    existing_meta = (decode(stored_meta) if stored_meta else None) or {}
+
+    # compare serialised values, as e.g. True == 1 in python but not in JSON
+    if stored_meta is not None and all(key in existing_meta and json_lib.dumps(existing_meta[key]) == json_lib.dumps(value)
+                                       for key, value in metadata.items()):
+        return None
+
+    existing_meta.update(metadata)
+    return encode(existing_meta)
+
 
 class JSONDidMeta(DidMetaPlugin):
     """
@@ -52,11 +154,12 @@ class JSONDidMeta(DidMetaPlugin):
             raise NotImplementedError
 
         try:
-            row = session.query(models.DidMeta).filter_by(scope=scope, name=name).one()
-            meta = getattr(row, 'meta')
-            return json_lib.loads(meta) if session.bind.dialect.name in ['oracle', 'sqlite'] else meta
+            meta = session.execute(_DID_META_META, {'scope': scope, 'name': name}).scalar_one()
         except NoResultFound:
             return {}
+        # string-backed dialects return the serialised object, the others one decoded for this query alone,
+        # which can be handed out without a copy
+        return json_lib.loads(meta) if isinstance(meta, str) else meta
 
     @transactional_session
     def set_metadata(self, scope, name, key, value, recursive=False, *, session: "Session"):
@@ -67,37 +170,82 @@ class JSONDidMeta(DidMetaPlugin):
         if not json_implemented(session=session):
             raise NotImplementedError
 
-        if session.query(models.DataIdentifier).filter_by(scope=scope, name=name).one_or_none() is None:
+        if session.bind.dialect.name == 'postgresql':
+            # merge the new keys into the stored object server-side, creating the row if needed, in one statement
+            # which also checks for the did. Only probe for the did if nothing was written.
+            if session.execute(_MERGE_UPSERT_IF_DID_EXISTS, {'scope': scope, 'name': name, 'meta': metadata}).first() is not None:
+                return
+
+        # only probe the primary key, rather than loading the whole row
+        if session.scalar(DID_SCOPE_QUERY, {'scope': scope, 'name': name}) is None:
             raise exception.DataIdentifierNotFound("Data identifier '%s:%s' not found" % (scope, name))
 
-        row_did_meta = session.query(models.DidMeta).filter_by(scope=scope, name=name).scalar()
+        if session.bind.dialect.name == 'postgresql':
+            # the stored object already holds the key-values
+            return
+
+        row_did_meta = session.execute(_DID_META_ROW, {'scope': scope, 'name': name}).scalar_one_or_none()
         if row_did_meta is None:
             # Add metadata column to new table (if not already present)
             row_did_meta = models.DidMeta(scope=scope, name=name)
             row_did_meta.save(session=session, flush=False)
 
-        existing_meta = {}
-        if hasattr(row_did_meta, 'meta'):
-            if row_did_meta.meta:
-                if session.bind.dialect.name in ['oracle', 'sqlite']:
-                    # Oracle and sqlite returns a string instead of a dict
-                    existing_meta = json_lib.loads(cast(str, row_did_meta.meta))
-                else:
-                    existing_meta = cast(dict[str, Any], row_did_meta.meta)
+        merged_meta = _merged_meta(row_did_meta.meta, metadata, _json_codec(session))
+        if merged_meta is None:
+            # nothing to write, the key-values are already stored
+            return
+        row_did_meta.meta = merged_meta
+        row_did_meta.save(session=session, flush=True)
 
-        for key, value in metadata.items():
-            existing_meta[key] = value
+    @transactional_session
+    def set_dids_metadata_bulk(self, dids, recursive=False, *, session: "Session"):
+        if not json_implemented(session=session):
+            raise NotImplementedError
 
-        row_did_meta.meta = None
+        # a did listed more than once is written once, with its key-values applied in order
+        did_metadata = {}
+        for did in dids:
+            did_metadata.setdefault((did['scope'], did['name']), {}).update(did['meta'])
+
+        existing_dids = set()
+        for chunk in chunks(list(did_metadata), 100):
+            stmt = select(
+                models.DataIdentifier.scope,
+                models.DataIdentifier.name
+            ).where(
+                or_(*[and_(models.DataIdentifier.scope == scope, models.DataIdentifier.name == name) for scope, name in chunk])
+            )
+            existing_dids.update((row.scope, row.name) for row in session.execute(stmt))
+        for scope, name in did_metadata:
+            if (scope, name) not in existing_dids:
+                raise exception.DataIdentifierNotFound("Data identifier '%s:%s' not found" % (scope, name))
+
+        if session.bind.dialect.name == 'postgresql':
+            for chunk in chunks(list(did_metadata.items()), 1000):
+                session.execute(_MERGE_UPSERT, [{'scope': scope, 'name': name, 'meta': metadata} for (scope, name), metadata in chunk])
+            return
+
+        rows_did_meta = {}
+        for chunk in chunks(list(did_metadata), 100):
+            stmt = select(
+                models.DidMeta
+            ).where(
+                or_(*[and_(models.DidMeta.scope == scope, models.DidMeta.name == name) for scope, name in chunk])
+            )
+            for row_did_meta in session.execute(stmt).scalars():
+                rows_did_meta[(row_did_meta.scope, row_did_meta.name)] = row_did_meta
+
+        codec = _json_codec(session)
+        for (scope, name), metadata in did_metadata.items():
+            row_did_meta = rows_did_meta.get((scope, name))
+            if row_did_meta is None:
+                row_did_meta = models.DidMeta(scope=scope, name=name)
+                session.add(row_did_meta)
+            merged_meta = _merged_meta(row_did_meta.meta, metadata, codec)
+            if merged_meta is not None:
+                row_did_meta.meta = merged_meta
         session.flush()
 
-        # Oracle insert takes a string as input
-        if session.bind.dialect.name in ['oracle', 'sqlite']:
-            existing_meta = json_lib.dumps(existing_meta)
-
-        row_did_meta.meta = existing_meta
-        row_did_meta.save(session=session, flush=True)
-
     @transactional_session
     def delete_metadata(self, scope, name, key, *, session: "Session"):
         """
@@ -111,36 +259,55 @@ class JSONDidMeta(DidMetaPlugin):
         if not json_implemented(session=session):
             raise NotImplementedError
 
-        try:
-            row = session.query(models.DidMeta).filter_by(scope=scope, name=name).one()
-            existing_meta = getattr(row, 'meta')
-            # Oracle returns a string instead of a dict
-            if session.bind.dialect.name in ['oracle', 'sqlite'] and existing_meta is not None:
-                existing_meta = json_lib.loads(existing_meta)
-
-            if key not in existing_meta:
+        if session.bind.dialect.name == 'postgresql':
+            # remove the key server-side, rather than round-tripping the whole object
+            stmt = update(
+                models.DidMeta
+            ).where(
+                models.DidMeta.scope == scope,
+                models.DidMeta.name == name,
+                models.DidMeta.meta.op('?', return_type=Boolean)(literal(key, String))
+            ).values(
+                meta=models.DidMeta.meta.op('-')(literal(key, String))
+            ).execution_options(
+                synchronize_session='fetch'
+            )
+            if session.execute(stmt).rowcount == 0:
+                if session.scalar(_DID_META_SCOPE, {'scope': scope, 'name': name}) is None:
+                    raise exception.DataIdentifierNotFound(f"Key not found for data identifier '{scope}:{name}'")
                 raise exception.KeyNotFound(key)
+            return
 
-            existing_meta.pop(key, None)
-
-            row.meta = None
-            session.flush()
-
-            # Oracle insert takes a string as input
-            if session.bind.dialect.name in ['oracle', 'sqlite']:
-                existing_meta = json_lib.dumps(existing_meta)
-
-            row.meta = existing_meta
+        try:
+            meta = session.execute(_DID_META_META, {'scope': scope, 'name': name}).scalar_one()
         except NoResultFound:
             raise exception.DataIdentifierNotFound(f"Key not found for data identifier '{scope}:{name}'")
 
+        encode, decode = _json_codec(session)
+        existing_meta = decode(meta) if meta is not None else {}
+        if key not in existing_meta:
+            raise exception.KeyNotFound(key)
+        del existing_meta[key]
+
+        stmt = update(
+            models.DidMeta
+        ).where(
+            models.DidMeta.scope == scope,
+            models.DidMeta.name == name
+        ).values(
+            meta=encode(existing_meta)
+        )
+        session.execute(stmt)
+
     @stream_session
     def list_dids(self, scope, filters, did_type='collection', ignore_case=False, limit=None,
                   offset=None, long=False, recursive=False, ignore_dids=None, *, session: "Session"):
         if not json_implemented(session=session):
             raise NotImplementedError
 
-        if not ignore_dids:
+        # a single query never returns a DID twice, so only the recursion needs to track the yielded DIDs.
+        # An empty set passed down the recursion must still be shared.
+        if ignore_dids is None and recursive:
             ignore_dids = set()
 
         # backwards compatibility for filters as single {}.
@@ -161,45 +328,121 @@ class JSONDidMeta(DidMetaPlugin):
             session=session
         )
 
+        if recursive:
+            # Only collections have content to recurse into, and their type is kept in the dids table.
+            query = query.add_columns(
+                models.DataIdentifier.did_type
+            ).join(
+                models.DataIdentifier,
+                and_(models.DataIdentifier.scope == models.DidMeta.scope,
+                     models.DataIdentifier.name == models.DidMeta.name)
+            )
         if limit:
             query = query.limit(limit)
-        if recursive:
-            from rucio.core.did import list_content
-
-            # Get attached DIDs and save in list because query has to be finished before starting a new one in the recursion
-            collections_content = []
-            for did in query.yield_per(100):
-                if (did.did_type == DIDType.CONTAINER or did.did_type == DIDType.DATASET):
-                    collections_content += [d for d in list_content(scope=did.scope, name=did.name)]
-
-            # Replace any name filtering with recursed DID names.
-            for did in collections_content:
-                for or_group in filters:
-                    or_group['name'] = did['name']
-                for result in self.list_dids(scope=did['scope'], filters=filters, recursive=True, did_type=did_type, limit=limit, offset=offset,
-                                             long=long, ignore_dids=ignore_dids, session=session):
-                    yield result
 
         try:
-            for did in query.yield_per(5):                  # don't unpack this as it makes it dependent on query return order!
+            if recursive:
+                # Read the result once, because the query has to be finished before the content of the collections is
+                # searched, and yield the matching content before the rows themselves.
+                dids = query.all()
+                dids = chain(self._list_dids_content(filters, dids, limit=limit, session=session), dids)
+                if limit:
+                    dids = islice(dids, limit)
+            else:
+                dids = query.yield_per(STREAM_BATCH_SIZE)
+
+            for did in dids:                                # don't unpack this as it makes it dependent on query return order!
+                if ignore_dids is not None:
+                    did_full = (did.scope, did.name)
+                    if did_full in ignore_dids:             # the recursion may reach a DID more than once
+                        continue
+                    ignore_dids.add(did_full)
                 if long:
-                    did_full = "{}:{}".format(did.scope, did.name)
-                    if did_full not in ignore_dids:         # concatenating results of OR clauses may contain duplicate DIDs if query result sets not mutually exclusive.
-                        ignore_dids.add(did_full)
-                        yield {
-                            'scope': did.scope,
-                            'name': did.name,
-                            'did_type': None,               # not available with JSON plugin
-                            'bytes': None,                  # not available with JSON plugin
-                            'length': None                  # not available with JSON plugin
-                        }
+                    did_long = LONG_DID_TEMPLATE.copy()     # did_type, bytes and length are not available with JSON plugin
+                    did_long['scope'] = did.scope
+                    did_long['name'] = did.name
+                    yield did_long
                 else:
-                    did_full = "{}:{}".format(did.scope, did.name)
-                    if did_full not in ignore_dids:         # concatenating results of OR clauses may contain duplicate DIDs if query result sets not mutually exclusive.
-                        ignore_dids.add(did_full)
-                        yield did.name
+                    yield did.name
         except DataError as e:
-            raise exception.InvalidMetadata("Database query failed: {}. This can be raised when the datatype of a key is inconsistent between dids.".format(e))
+            raise exception.InvalidMetadata("Database query failed: {}. This can be raised when the datatype of a key is inconsistent between dids.".format(e)) from e
+
+    def _list_dids_content(self, filters, dids, limit, *, session: "Session"):
+        """
+        Search the content of the given dids recursively, yielding the rows of the matching children.
+
+        The tree is walked by one recursive query per batch of collections, which only descends into the children
+        matching the filters.
+
+        :param filters: The filters of the search. Their name filters are replaced by the names of the children.
+        :param dids: The dids to list the content of, with their scope, name and did_type.
+        :param limit: The maximum number of rows to yield across all the collections.
+        """
+        collections = [(did.scope, did.name) for did in dids if did.did_type in COLLECTION_TYPES]
+        if not collections:
+            return
+
+        # Replace any name filtering with the recursed DID names, without altering the caller's filters.
+        content_filters = [{key: value for key, value in or_group.items() if key != 'name'} for or_group in filters]
+        if all(content_filters):
+            fe = FilterEngine(content_filters, model_class=models.DidMeta, strict_coerce=False)
+            matching = fe.create_sqla_query(
+                additional_model_attributes=[
+                    models.DidMeta.scope,
+                    models.DidMeta.name
+                ],
+                json_column=models.DidMeta.meta,
+                session=session
+            ).whereclause
+        else:
+            matching = true()                               # an or_group without any other filter matches all children
+
+        contents = models.DataIdentifierAssociation
+        remaining = limit
+        for chunk in chunks(collections, 100):
+            content = select(
+                contents.child_scope,
+                contents.child_name
+            ).where(
+                or_(*[and_(contents.scope == collection_scope, contents.name == collection_name)
+                      for collection_scope, collection_name in chunk])
+            ).cte(
+                'content', recursive=True
+            )
+            content = content.union_all(
+                select(
+                    contents.child_scope,
+                    contents.child_name
+                ).join(
+                    content,
+                    and_(contents.scope == content.c.child_scope, contents.name == content.c.child_name)
+                ).join(
+                    models.DidMeta,
+                    and_(models.DidMeta.scope == content.c.child_scope, models.DidMeta.name == content.c.child_name)
+                ).where(
+                    matching
+                )
+            )
+            stmt = select(
+                models.DidMeta.scope,
+                models.DidMeta.name
+            ).distinct(
+            ).join(
+                content,
+                and_(models.DidMeta.scope == content.c.child_scope, models.DidMeta.name == content.c.child_name)
+            ).where(
+                matching
+            ).execution_options(
+                yield_per=STREAM_BATCH_SIZE
+            )
+            if limit:
+                stmt = stmt.limit(remaining)
+            for row in session.execute(stmt):
+                yield row
+                if limit:
+                    remaining -= 1
+            if limit and remaining <= 0:
+                return
 
     @read_session
     def manages_key(self, key, *, session: "Session"):
@@ -152,8 +152,8 @@ class MongoDidMeta(DidMetaPlugin):
         meta = {key: ""}
         try:
             self.col.update_one({"_id": "{}:{}".format(scope.internal, name)}, {'$unset': meta})
-        except Exception as e:
-            raise exception.DataIdentifierNotFound(e)
+        except pymongo.errors.PyMongoError as e:
+            raise exception.DataIdentifierNotFound(e) from e
 
     def list_dids(self, scope, filters, did_type='collection', ignore_case=False, limit=None,
                   offset=None, long=False, recursive=False, ignore_dids=None, *, session: "Optional[Session]" = None):
@@ -184,7 +184,7 @@ class MongoDidMeta(DidMetaPlugin):
             if limit:
                 query_result = query_result.limit(limit)
             for did in query_result:
-                did_full = "{}:{}".format(did['scope'], did['name'])
+                did_full = (did['scope'], did['name'])
                 if did_full not in ignore_dids:         # aggregating recursive queries may contain duplicate DIDs
                     ignore_dids.add(did_full)
                     yield {
@@ -199,7 +199,7 @@ class MongoDidMeta(DidMetaPlugin):
             if limit:
                 query_result = query_result.limit(limit)
             for did in query_result:
-                did_full = "{}:{}".format(did['scope'], did['name'])
+                did_full = (did['scope'], did['name'])
                 if did_full not in ignore_dids:         # aggregating recursive queries may contain duplicate DIDs
                     ignore_dids.add(did_full)
                     yield did['name']
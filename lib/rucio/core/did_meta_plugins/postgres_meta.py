@@ -14,14 +14,18 @@
 
 import json
 import operator
+import threading
+from contextlib import contextmanager
 from typing import TYPE_CHECKING
 
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+from psycopg2 import sql
 
 from rucio.common import config, exception
 from rucio.common.types import InternalScope
-from rucio.core.did_meta_plugins.did_meta_plugin_interface import DidMetaPlugin
+from rucio.core.did_meta_plugins.did_meta_plugin_interface import LONG_DID_TEMPLATE, STREAM_BATCH_SIZE, DidMetaPlugin
 from rucio.core.did_meta_plugins.filter_engine import FilterEngine
 
 if TYPE_CHECKING:
@@ -29,6 +33,34 @@ if TYPE_CHECKING:
 
     from sqlalchemy.orm import Session
 
+# unknown fields of the long format are reported as "N/A" by this plugin
+_LONG_DID_TEMPLATE = dict(LONG_DID_TEMPLATE, did_type="N/A", bytes="N/A", length="N/A")
+
+
+def _identifier_parts(name, max_parts=2):
+    """
+    Split a configured table or column name into the parts of its identifier, resolved like the unquoted name in a
+    statement.
+
+    The name may be qualified, e.g. by a schema. Unquoted parts are folded to lower case, double-quoted parts kept as is.
+
+    :param name: the configured name, e.g. ``dids``, ``metadata.dids`` or ``"DidMeta"``.
+    :param max_parts: the maximum number of parts of the name.
+    :returns: the list of name parts.
+    :raises: ConfigurationError
+    """
+    parts = []
+    for part in name.split('.'):
+        if len(part) > 1 and part.startswith('"') and part.endswith('"'):
+            parts.append(part[1:-1])
+        elif part and '"' not in part:
+            parts.append(part.lower())
+        else:
+            raise exception.ConfigurationError("Invalid metadata table or column name '{}'".format(name))
+    if len(parts) > max_parts:
+        raise exception.ConfigurationError("Invalid metadata table or column name '{}'".format(name))
+    return parts
+
 
 class ExternalPostgresDidMeta(DidMetaPlugin):
     # TODO: column-based plugin? mixed-mode (json & columns)?
@@ -38,7 +70,7 @@ class ExternalPostgresDidMeta(DidMetaPlugin):
 class ExternalPostgresJSONDidMeta(DidMetaPlugin):
     def __init__(self, host=None, port=None, db=None, user=None, password=None, db_schema=None, table=None,
                  table_is_managed=None, table_column_vo=None, table_column_scope=None, table_column_name=None,
-                 table_column_data=None):
+                 table_column_data=None, pool_min_connections=None, pool_max_connections=None, pool_timeout=None):
         super(ExternalPostgresJSONDidMeta, self).__init__()
         if host is None:
             host = config.config_get('metadata', 'postgres_service_host')
@@ -64,6 +96,12 @@ class ExternalPostgresJSONDidMeta(DidMetaPlugin):
             table_column_name = config.config_get('metadata', 'postgres_table_column_name', default='name')
         if table_column_data is None:
             table_column_data = config.config_get('metadata', 'postgres_table_column_data', default='data')
+        if pool_min_connections is None:
+            pool_min_connections = config.config_get_int('metadata', 'postgres_pool_min_connections', default=1)
+        if pool_max_connections is None:
+            pool_max_connections = config.config_get_int('metadata', 'postgres_pool_max_connections', default=10)
+        if pool_timeout is None:
+            pool_timeout = config.config_get_int('metadata', 'postgres_pool_timeout', default=30)
 
         self.fixed_table_columns = {
             'vo': table_column_vo,
@@ -73,18 +111,25 @@ class ExternalPostgresJSONDidMeta(DidMetaPlugin):
         self.jsonb_column = table_column_data
 
         self.table = table
-        self.client = psycopg2.connect(
+        # compose the configured name into statements as the identifier it was resolved to before quoting
+        table_identifier_parts = _identifier_parts(table)
+        self.table_identifier = sql.Identifier(*table_identifier_parts)
+        self.index_identifier = sql.Identifier("{}_data_idx".format(table_identifier_parts[-1]))
+        # the plugin instance is shared by all threads of the server, so hand out one connection per call.
+        # search_path is set at connection startup so that pooled connections need no extra round trip. libpq splits
+        # the options on whitespace, so escape any in the value, e.g. of "myschema, public".
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            pool_min_connections,
+            pool_max_connections,
             host=host,
             port=port,
             database=db,
             user=user,
-            password=password)
-
-        # set search_path to include database schema by default
-        cur = self.client.cursor()
-        statement = "SET search_path TO {};".format(db_schema)
-        cur.execute(statement)
-        cur.close()
+            password=password,
+            options='-c search_path={}'.format(db_schema.replace('\\', '\\\\').replace(' ', '\\ ')))
+        # the pool raises rather than waits once all its connections are in use, so make callers queue for one
+        self.pool_slots = threading.BoundedSemaphore(pool_max_connections)
+        self.pool_timeout = pool_timeout
 
         if not table_is_managed:                    # not managed by Rucio, so just verify table schema
             self._verify_table_schema(table_column_vo, table_column_scope, table_column_name, table_column_data)
@@ -93,6 +138,29 @@ class ExternalPostgresJSONDidMeta(DidMetaPlugin):
 
         self.plugin_name = "POSTGRES_JSON"
 
+    @contextmanager
+    def _connection(self):
+        """
+        Borrow a connection from the pool, returning it (rolled back if left in a transaction) when done.
+
+        Waits up to the pool timeout for a connection to be returned if all of them are in use.
+
+        :raises: DatabaseException
+        """
+        if not self.pool_slots.acquire(timeout=self.pool_timeout):
+            raise exception.DatabaseException("No metadata database connection became available within {} seconds".format(self.pool_timeout))
+        try:
+            try:
+                conn = self.pool.getconn()
+            except psycopg2.pool.PoolError as error:
+                raise exception.DatabaseException(error) from error
+            try:
+                yield conn
+            finally:
+                self.pool.putconn(conn)
+        finally:
+            self.pool_slots.release()
+
     def _try_create_metadata_table(self):
         """
         Try to create a metadata table.
@@ -105,14 +173,39 @@ class ExternalPostgresJSONDidMeta(DidMetaPlugin):
             ("data", "jsonb", "DEFAULT", "'{}'::jsonb"),
             ("UNIQUE", "(scope, name)")  # unique scope+name table constraint, required for ON CONFLICT
         )
-        statement = "CREATE TABLE IF NOT EXISTS {} ({})".format(
-            self.table,
-            ', '.join([' '.join(clause) for clause in table_clauses]))
+        statement = sql.SQL("CREATE TABLE IF NOT EXISTS {} ({})").format(
+            self.table_identifier,
+            sql.SQL(', '.join([' '.join(clause) for clause in table_clauses])))
+
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(statement)
+            cur.close()
+            conn.commit()
 
-        cur = self.client.cursor()
-        cur.execute(statement)
-        cur.close()
-        self.client.commit()
+        # tables created before the filter engine matched strings by containment lack the index, so build it now
+        self.create_metadata_index()
+
+    def create_metadata_index(self):
+        """
+        Create the jsonb_path_ops GIN index backing the containment (@>) equality filters built by the filter engine,
+        if it is missing.
+
+        Called on start-up for tables managed by Rucio. The index is built concurrently, so that an existing table
+        remains writable in the meantime, and externally managed tables can be indexed by calling this once.
+        """
+        statement = sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} USING GIN ({} jsonb_path_ops)").format(
+            self.index_identifier,
+            self.table_identifier,
+            sql.Identifier(*_identifier_parts(self.jsonb_column, max_parts=1)))
+        with self._connection() as conn:
+            conn.autocommit = True                  # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+            try:
+                cur = conn.cursor()
+                cur.execute(statement)
+                cur.close()
+            finally:
+                conn.autocommit = False
 
     def _verify_table_schema(self, table_column_vo, table_column_scope, table_column_name, table_column_data):
         """
@@ -126,13 +219,26 @@ class ExternalPostgresJSONDidMeta(DidMetaPlugin):
         :param table_column_data: The table column used for the data
         :raises: MetadataSchemaMismatchError
         """
+        # Resolve the table name like statements do, i.e. through the search path if it isn't schema-qualified.
+        statement = "SELECT nsp.nspname, rel.relname FROM pg_class rel " \
+                    "INNER JOIN pg_namespace nsp ON nsp.oid = rel.relnamespace " \
+                    "WHERE rel.oid = to_regclass(%s);"
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(statement, (self.table,))
+            table_parts = cur.fetchone()
+            cur.close()
+        if table_parts is None:
+            raise exception.MetadataSchemaMismatchError("metadata table {} does not exist".format(self.table))
+
         # Check mandatory columns are of right data type and have the right nullable qualifier.
         statement = "SELECT column_name, data_type, is_nullable " \
-                    "FROM INFORMATION_SCHEMA.COLUMNS where table_name = '{}';".format(self.table)
-        cur = self.client.cursor()
-        cur.execute(statement)
-        existing_table_columns = cur.fetchall()
-        cur.close()
+                    "FROM INFORMATION_SCHEMA.COLUMNS where table_schema = %s AND table_name = %s;"
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(statement, table_parts)
+            existing_table_columns = cur.fetchall()
+            cur.close()
 
         mandatory_column_specifications = [
             (table_column_vo, "character varying", "NO"),
@@ -154,11 +260,12 @@ class ExternalPostgresJSONDidMeta(DidMetaPlugin):
                     "FROM pg_constraint con " \
                     "INNER JOIN pg_class rel ON rel.oid = con.conrelid " \
                     "INNER JOIN pg_namespace nsp ON nsp.oid = rel.relnamespace " \
-                    "WHERE rel.relname = '{}';".format(self.table)
-        cur = self.client.cursor()
-        cur.execute(statement)
-        existing_table_constraints = cur.fetchall()  # list of (constraint_type, [columns])
-        cur.close()
+                    "WHERE nsp.nspname = %s AND rel.relname = %s;"
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(statement, table_parts)
+            existing_table_constraints = cur.fetchall()  # list of (constraint_type, [columns])
+            cur.close()
 
         mandatory_table_constraints = [
             ("u", [table_column_scope, table_column_name]),  # unique scope+name table constraint
@@ -170,11 +277,12 @@ class ExternalPostgresJSONDidMeta(DidMetaPlugin):
                         constraint, len(existing_table_constraints)))
 
     def _drop_metadata_table(self):
-        statement = "DROP TABLE IF EXISTS {};".format(self.table)
-        cur = self.client.cursor()
-        cur.execute(statement)
-        cur.close()
-        self.client.commit()
+        statement = sql.SQL("DROP TABLE IF EXISTS {};").format(self.table_identifier)
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(statement)
+            cur.close()
+            conn.commit()
 
     def get_metadata(self, scope, name, *, session: "Optional[Session]" = None):
         """
@@ -185,12 +293,12 @@ class ExternalPostgresJSONDidMeta(DidMetaPlugin):
         :param session: The database session in use
         :returns: the metadata for the did
         """
-        statement = "SELECT data from {} ".format(self.table) + \
-                    "WHERE scope='{}' AND name='{}';".format(scope.internal, name)
-        cur = self.client.cursor()
-        cur.execute(statement)
-        metadata = cur.fetchone()
-        cur.close()
+        statement = sql.SQL("SELECT data from {} WHERE scope=%s AND name=%s;").format(self.table_identifier)
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(statement, (scope.internal, name))
+            metadata = cur.fetchone()
+            cur.close()
 
         if not metadata:
             raise exception.DataIdentifierNotFound("No metadata found for did '{}:{}".format(scope, name))
@@ -221,13 +329,14 @@ class ExternalPostgresJSONDidMeta(DidMetaPlugin):
         :param session: The database session in use
         """
         # upsert metadata
-        statement = "INSERT INTO {} (scope, name, vo, data) ".format(self.table) + \
-                    "VALUES ('{}', '{}', '{}', '{}') ".format(scope.external, name, scope.vo, json.dumps(metadata)) + \
-                    "ON CONFLICT (scope, name) DO UPDATE set data = {}.data || EXCLUDED.data;".format(self.table)
-        cur = self.client.cursor()
-        cur.execute(statement)
-        cur.close()
-        self.client.commit()
+        statement = sql.SQL("INSERT INTO {table} (scope, name, vo, data) VALUES (%s, %s, %s, %s) "
+                            "ON CONFLICT (scope, name) DO UPDATE set data = {table}.data || EXCLUDED.data;").format(
+            table=self.table_identifier)
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(statement, (scope.external, name, scope.vo, json.dumps(metadata)))
+            cur.close()
+            conn.commit()
 
     def delete_metadata(self, scope, name, key, *, session: "Optional[Session]" = None):
         """
@@ -238,19 +347,42 @@ class ExternalPostgresJSONDidMeta(DidMetaPlugin):
         :param key: the key to be deleted
         :param session: the database session in use
         """
-        statement = "UPDATE {} ".format(self.table) + \
-                    "SET data = {}.data - '{}';".format(self.table, key)
-        cur = self.client.cursor()
-        cur.execute(statement)
-        cur.close()
-        self.client.commit()
+        # remove the key server-side, only touching the did's row if it holds the key
+        statement = sql.SQL("UPDATE {table} SET data = {table}.data - %s "
+                            "WHERE scope=%s AND name=%s AND {table}.data ? %s;").format(table=self.table_identifier)
+        with self._connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(statement, (key, scope.internal, name, key))
+                if cur.rowcount == 0:
+                    cur.execute(sql.SQL("SELECT 1 FROM {} WHERE scope=%s AND name=%s;").format(self.table_identifier),
+                                (scope.internal, name))
+                    if cur.fetchone() is None:
+                        raise exception.DataIdentifierNotFound("No metadata found for did '{}:{}".format(scope, name))
+                    raise exception.KeyNotFound(key)
+            finally:
+                cur.close()
+            conn.commit()
 
     def list_dids(self, scope, filters, did_type='collection', ignore_case=False, limit=None,
                   offset=None, long=False, recursive=False, ignore_dids=None, *, session: "Optional[Session]" = None):
-
-        if not ignore_dids:
-            ignore_dids = set()
-
+        """
+        Search data identifiers.
+
+        The results are fetched from the metadata database in batches, each on a connection that is returned to
+        the pool before any of its DIDs are yielded.
+
+        :param scope: the scope name.
+        :param filters: dictionary of attributes by which the results should be filtered.
+        :param did_type: the type of the did (not supported).
+        :param ignore_case: ignore case distinctions (not supported).
+        :param limit: limit number.
+        :param offset: offset number (not supported).
+        :param long: Long format option to display more information for each DID.
+        :param recursive: Recursively list DIDs content (not supported).
+        :param ignore_dids: Set of (scope, name) tuples of DIDs to refrain from yielding.
+        :param session: The database session in use.
+        """
         # backwards compatibility for filters as single {}.
         if isinstance(filters, dict):
             filters = [filters]
@@ -266,8 +398,8 @@ class ExternalPostgresJSONDidMeta(DidMetaPlugin):
                 fixed_table_columns=self.fixed_table_columns,
                 jsonb_column=self.jsonb_column
             )
-        except Exception as e:
-            raise exception.DataIdentifierNotFound(e)
+        except (exception.RucioException, ValueError) as e:
+            raise exception.DataIdentifierNotFound(e) from e
 
         if recursive:
             # TODO: possible, but requires retrieving the results of a concurrent sqla query to call list_content
@@ -276,33 +408,46 @@ class ExternalPostgresJSONDidMeta(DidMetaPlugin):
                 "'{}' metadata module does not currently support recursive searches".format(self.plugin_name.lower())
             )
 
-        statement = "SELECT * FROM {} WHERE {} ".format(self.table, postgres_query_str)
-        if limit:
-            statement += "LIMIT {}".format(limit)
-        cur = self.client.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute(statement)
-        query_result = cur.fetchall()
-        cur.close()
-
-        if long:
-            for row in query_result:
-                did = "{}:{}".format(row['scope'], row['name'])
-                if did not in ignore_dids:         # aggregating recursive queries may contain duplicate DIDs
-                    ignore_dids.add(did)
-                    yield {
-                        'scope': InternalScope(row['scope']),
-                        'name': row['name'],
-                        'did_type': "N/A",
-                        'bytes': "N/A",
-                        'length': "N/A"
-                    }
-        else:
-            for row in query_result:
-                did = "{}:{}".format(row['scope'], row['name'])
-                if did not in ignore_dids:         # aggregating recursive queries may contain duplicate DIDs
+        # the filter expression is already rendered SQL, so compose rather than pass parameters (which would make
+        # psycopg2 interpret any literal % in it)
+        query = sql.SQL("SELECT * FROM {} WHERE ({})").format(self.table_identifier, sql.SQL(postgres_query_str))
+        # page through the result by (scope, name), so that no pooled connection is held while the caller iterates
+        last_did = None
+        remaining = limit
+        while True:
+            batch_size = STREAM_BATCH_SIZE if not remaining else min(remaining, STREAM_BATCH_SIZE)
+            statement = query
+            if last_did is not None:
+                statement += sql.SQL(" AND (scope, name) > ({}, {})").format(*map(sql.Literal, last_did))
+            statement += sql.SQL(" ORDER BY scope, name LIMIT {}").format(sql.Literal(batch_size))
+            with self._connection() as conn:
+                cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+                try:
+                    cur.execute(statement)
+                    rows = cur.fetchall()
+                finally:
+                    cur.close()
+
+            for row in rows:
+                if ignore_dids is not None:    # a single query never returns a DID twice, only skip the ones given
+                    did = (row['scope'], row['name'])
+                    if did in ignore_dids:
+                        continue
                     ignore_dids.add(did)
+                if long:
+                    did_long = _LONG_DID_TEMPLATE.copy()
+                    did_long['scope'] = InternalScope(row['scope'])
+                    did_long['name'] = row['name']
+                    yield did_long
+                else:
                     yield row['name']
 
+            if remaining:
+                remaining -= len(rows)
+            if len(rows) < batch_size or (limit and remaining <= 0):
+                break
+            last_did = (rows[-1]['scope'], rows[-1]['name'])
+
     def manages_key(self, key, *, session: "Optional[Session]" = None):
         return True
 
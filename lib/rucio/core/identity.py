@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import hashlib
+import hmac
 import os
 from re import match
 from typing import TYPE_CHECKING, Optional
@@ -94,9 +95,11 @@ def verify_identity(identity: str, type_: IdentityType, password: Optional[str]
     if type_ == IdentityType.X509:
         return True
     elif type_ == IdentityType.USERPASS:
+        if id_.salt is None or id_.password is None:
+            raise exception.IdentityNotFound('No password set for userpass identity \'%s\'!' % identity)
         salted_password = id_.salt + password.encode()
         password = hashlib.sha256(salted_password).hexdigest()
-        if password != id_.password:
+        if not hmac.compare_digest(password.encode(), id_.password.encode()):
             raise exception.IdentityNotFound('Password does not match for userpass identity \'%s\'!' % identity)
         return True
     else:
@@ -17,8 +17,8 @@ from datetime import datetime
 from hashlib import sha256
 from os import urandom
 from typing import TYPE_CHECKING, Any, Optional, TypeVar, Union
+from weakref import WeakKeyDictionary
 
-import sqlalchemy
 from alembic import command, op
 from alembic.config import Config
 from dogpile.cache.api import NoValue
@@ -105,29 +105,46 @@ def drop_everything() -> None:
     with engine.connect() as conn:
 
         inspector: Union["Inspector", PGInspector] = inspect(conn)
-
-        for tname, fkcs in reversed(
-                inspector.get_sorted_table_and_fkc_names(schema='*')):
-            if tname:
-                drop_table_stmt = DropTable(Table(tname, MetaData(), schema='*'))
-                conn.execute(drop_table_stmt)
-            elif fkcs:
-                if not engine.dialect.supports_alter:
-                    continue
-                for tname, fkc in fkcs:
-                    fk_constraint = ForeignKeyConstraint((), (), name=fkc)
-                    Table(tname, MetaData(), fk_constraint)
-                    drop_constraint_stmt = DropConstraint(fk_constraint)
-                    conn.execute(drop_constraint_stmt)
-
         schema = config_get('database', 'schema', raise_exception=False)
-        if schema:
+
+        if engine.dialect.name == 'postgresql' and schema:
+            # the cascade takes the tables, constraints and sequences along
+            # in one statement, no need to gather and drop them one by one
             conn.execute(DropSchema(schema, cascade=True))
+        else:
+            # an already emptied database only holds the version table (if anything),
+            # so skip the foreign key reflection needed to sort the tables
+            table_names = inspector.get_table_names(schema='*')
+            if set(table_names) <= {'alembic_version'}:
+                sorted_tables = [(tname, []) for tname in table_names]
+            else:
+                sorted_tables = inspector.get_sorted_table_and_fkc_names(schema='*')
+
+            for tname, fkcs in reversed(sorted_tables):
+                if tname:
+                    drop_table_stmt = DropTable(Table(tname, MetaData(), schema='*'))
+                    conn.execute(drop_table_stmt)
+                elif fkcs:
+                    if not engine.dialect.supports_alter:
+                        continue
+                    for tname, fkc in fkcs:
+                        fk_constraint = ForeignKeyConstraint((), (), name=fkc)
+                        Table(tname, MetaData(), fk_constraint)
+                        drop_constraint_stmt = DropConstraint(fk_constraint)
+                        conn.execute(drop_constraint_stmt)
+
+            if schema:
+                conn.execute(DropSchema(schema, cascade=True))
 
         if engine.dialect.name == 'postgresql':
             assert isinstance(inspector, PGInspector), 'expected a PGInspector'
-            for enum in inspector.get_enums(schema='*'):
-                sqlalchemy.Enum(**enum).drop(bind=conn)
+            # drop all remaining enum types in a single statement
+            preparer = conn.dialect.identifier_preparer
+            enum_names = [preparer.quote(enum['name']) if enum['schema'] is None
+                          else '%s.%s' % (preparer.quote_schema(enum['schema']), preparer.quote(enum['name']))
+                          for enum in inspector.get_enums(schema='*')]
+            if enum_names:
+                conn.execute(text('DROP TYPE IF EXISTS %s' % ', '.join(enum_names)))
 
 
 def create_base_vo() -> None:
@@ -281,6 +298,9 @@ def is_old_db() -> bool:
             return (len(query) != 0 and str(query[0].version_num) != alembicrevision.ALEMBIC_REVISION)
 
 
+_JSON_IMPLEMENTED_BY_ENGINE: "WeakKeyDictionary[Any, bool]" = WeakKeyDictionary()
+
+
 def json_implemented(*, session: Optional["Session"] = None) -> bool:
     """
     Checks if the database on the current server installation can support json fields.
@@ -292,14 +312,22 @@ def json_implemented(*, session: Optional["Session"] = None) -> bool:
     if session is None:
         session = get_session()
 
+    # the answer only depends on the database behind the engine, so it is probed once per engine
+    try:
+        return _JSON_IMPLEMENTED_BY_ENGINE[session.bind]
+    except KeyError:
+        pass
+
+    implemented = True
     if session.bind.dialect.name == 'oracle':
         oracle_version = int(session.connection().connection.version.split('.')[0])
         if oracle_version < 12:
-            return False
+            implemented = False
     elif session.bind.dialect.name == 'sqlite':
-        return False
+        implemented = False
 
-    return True
+    _JSON_IMPLEMENTED_BY_ENGINE[session.bind] = implemented
+    return implemented
 
 
 def try_drop_constraint(constraint_name: str, table_name: str) -> None:
@@ -17,9 +17,10 @@ import time
 
 import pytest
 from requests import session
+from sqlalchemy import update
 
 from rucio.common.exception import AccessDenied, CannotAuthenticate, Duplicate
-from rucio.common.utils import ssh_sign
+from rucio.common.utils import generate_uuid, ssh_sign
 from rucio.core.authentication import strip_x509_proxy_attributes
 from rucio.core.identity import add_account_identity, del_account_identity
 from rucio.db.sqla import models
@@ -114,6 +115,19 @@ class TestAuthCoreGateway:
         result = get_auth_token_user_pass(account='root', username='ddmlab', password='not_secret', appid='test', ip='127.0.0.1', vo=vo)
         assert result is None
 
+    def test_get_auth_token_user_pass_without_password(self, vo, root_account, db_session):
+        """AUTHENTICATION (CORE): Username and password (identity without a stored password)."""
+        username = 'nopass_%s' % generate_uuid()
+        add_account_identity(username, IdentityType.USERPASS, root_account, email='ph-adp-ddm-lab@cern.ch', password='secret')
+        db_session.execute(update(models.Identity).where(models.Identity.identity == username,
+                                                         models.Identity.identity_type == IdentityType.USERPASS).values(password=None))
+        db_session.commit()
+
+        result = get_auth_token_user_pass(account='root', username=username, password='secret', appid='test', ip='127.0.0.1', vo=vo)
+        assert result is None
+
+        del_account_identity(username, IdentityType.USERPASS, root_account)
+
     def test_get_auth_token_ssh_success(self, vo, root_account):
         """AUTHENTICATION (CORE): SSH RSA public key exchange (good signature)."""
 
@@ -12,17 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
+from unittest import mock
 
 import pytest
+from sqlalchemy import JSON, insert, null
+from sqlalchemy.exc import StatementError
 
 from rucio.client.didclient import DIDClient
-from rucio.common.exception import KeyNotFound
+from rucio.common.exception import DatabaseException, DataIdentifierNotFound, KeyNotFound
 from rucio.common.utils import generate_uuid
-from rucio.core.did import add_did, delete_dids, set_dids_metadata_bulk, set_metadata_bulk
-from rucio.core.did_meta_plugins import get_metadata, list_dids, set_metadata
+from rucio.core.did import add_did, attach_dids, delete_dids, set_dids_metadata_bulk, set_metadata_bulk
+from rucio.core.did_meta_plugins import delete_metadata, get_metadata, list_dids, set_metadata
 from rucio.core.did_meta_plugins.mongo_meta import MongoDidMeta
 from rucio.core.did_meta_plugins.postgres_meta import ExternalPostgresJSONDidMeta
+from rucio.db.sqla import models
 from rucio.db.sqla.util import json_implemented
 from rucio.tests.common import did_name_generator, skip_rse_tests_with_accounts
 
@@ -105,6 +110,37 @@ class TestDidMetaDidColumn:
         # with pytest.raises(KeyNotFound):
         #     list_dids(tmp_scope, {'NotReallyAKey': 'NotReallyAValue'})
 
+    @pytest.mark.dirty
+    def test_list_did_meta_recursive(self, mock_scope, root_account):
+        """ DID Meta (Hardcoded): List did meta recursively into collections """
+        project1 = 'project_%s' % generate_uuid()
+        project2 = 'project_%s' % generate_uuid()
+
+        tmp_cnt1 = did_name_generator('container')
+        tmp_cnt2 = did_name_generator('container')
+        tmp_dsn1 = did_name_generator('dataset')
+        tmp_dsn2 = did_name_generator('dataset')
+        tmp_dsn3 = did_name_generator('dataset')
+        tmp_dsn4 = did_name_generator('dataset')
+        add_did(scope=mock_scope, name=tmp_cnt1, did_type="CONTAINER", account=root_account, meta={'project': project1})
+        add_did(scope=mock_scope, name=tmp_cnt2, did_type="CONTAINER", account=root_account, meta={'project': project2})
+        add_did(scope=mock_scope, name=tmp_dsn1, did_type="DATASET", account=root_account, meta={'project': project1})
+        add_did(scope=mock_scope, name=tmp_dsn2, did_type="DATASET", account=root_account, meta={'project': project2})
+        add_did(scope=mock_scope, name=tmp_dsn3, did_type="DATASET", account=root_account, meta={'project': project2})
+        add_did(scope=mock_scope, name=tmp_dsn4, did_type="DATASET", account=root_account, meta={'project': 'other'})
+        attach_dids(scope=mock_scope, name=tmp_cnt1, dids=[{'scope': mock_scope, 'name': tmp_dsn1},
+                                                           {'scope': mock_scope, 'name': tmp_dsn2}], account=root_account)
+        attach_dids(scope=mock_scope, name=tmp_cnt2, dids=[{'scope': mock_scope, 'name': tmp_dsn3},
+                                                           {'scope': mock_scope, 'name': tmp_dsn4}], account=root_account)
+
+        filters = [{'name': tmp_cnt1, 'project': project1, 'type': 'container'},
+                   {'name': tmp_cnt2, 'project': project2, 'type': 'container'}]
+        expected_filters = deepcopy(filters)
+        for _ in range(2):
+            results = list_dids(mock_scope, filters, recursive=True)
+            assert sorted(results) == sorted([tmp_cnt1, tmp_cnt2, tmp_dsn1, tmp_dsn2, tmp_dsn3])
+            assert filters == expected_filters
+
 
 class TestDidMetaJSON:
 
@@ -132,6 +168,82 @@ class TestDidMetaJSON:
         set_metadata(scope=mock_scope, name=did_name, key=meta_key, value=meta_value)
         assert get_metadata(scope=mock_scope, name=did_name, plugin='JSON')[meta_key] == meta_value
 
+    @pytest.mark.dirty
+    def test_set_metadata_json_values(self, mock_scope, root_account):
+        """ DID Meta (JSON): Set values which only the stdlib json module serialises """
+        skip_without_json()
+
+        did_name = did_name_generator('dataset')
+        meta_key1 = 'my_key_%s' % generate_uuid()
+        meta_key2 = 'my_key_%s' % generate_uuid()
+        add_did(scope=mock_scope, name=did_name, did_type='DATASET', account=root_account)
+        set_metadata_bulk(scope=mock_scope, name=did_name, meta={meta_key1: 2 ** 70, meta_key2: {1: 'one'}})
+        set_metadata_bulk(scope=mock_scope, name=did_name, meta={meta_key1: 2 ** 70, meta_key2: {1: 'one'}})
+        meta = get_metadata(scope=mock_scope, name=did_name, plugin='JSON')
+        assert meta[meta_key1] == 2 ** 70
+        assert meta[meta_key2] == {'1': 'one'}
+
+    @pytest.mark.dirty
+    @pytest.mark.parametrize("stored_meta", ["sql-null", "json-null"])
+    def test_set_metadata_null_meta(self, stored_meta, mock_scope, root_account, db_session):
+        """ DID Meta (JSON): Set did meta over a stored null """
+        skip_without_json()
+
+        did_name1 = did_name_generator('dataset')
+        did_name2 = did_name_generator('dataset')
+        meta_key = 'my_key_%s' % generate_uuid()
+        meta_value = 'my_value_%s' % generate_uuid()
+        if stored_meta == 'sql-null':
+            meta = null()
+        elif db_session.bind.dialect.name in ['oracle', 'sqlite']:
+            meta = 'null'
+        else:
+            meta = JSON.NULL
+        for did_name in [did_name1, did_name2]:
+            add_did(scope=mock_scope, name=did_name, did_type='DATASET', account=root_account)
+            db_session.execute(insert(models.DidMeta).values(scope=mock_scope, name=did_name, meta=meta))
+        db_session.commit()
+
+        set_metadata(scope=mock_scope, name=did_name1, key=meta_key, value=meta_value)
+        set_dids_metadata_bulk(dids=[{'scope': mock_scope, 'name': did_name2, 'meta': {meta_key: meta_value}}])
+        for did_name in [did_name1, did_name2]:
+            assert get_metadata(scope=mock_scope, name=did_name, plugin='JSON') == {meta_key: meta_value}
+
+    @pytest.mark.dirty
+    def test_set_metadata_invalid_value(self, mock_scope, root_account, db_session):
+        """ DID Meta (JSON): Fail within the set call on an unwritable value """
+        skip_without_json()
+
+        did_name = did_name_generator('dataset')
+        meta_key = 'my_key_%s' % generate_uuid()
+        add_did(scope=mock_scope, name=did_name, did_type='DATASET', account=root_account)
+
+        with pytest.raises((TypeError, StatementError)):
+            set_metadata(scope=mock_scope, name=did_name, key=meta_key, value=object(), session=db_session)
+        db_session.rollback()
+        with pytest.raises((TypeError, StatementError)):
+            set_dids_metadata_bulk(dids=[{'scope': mock_scope, 'name': did_name, 'meta': {meta_key: object()}}], session=db_session)
+        db_session.rollback()
+
+    @pytest.mark.dirty
+    def test_delete_did_meta(self, mock_scope, root_account):
+        """ DID Meta (JSON): Delete did meta """
+        skip_without_json()
+
+        did_name = did_name_generator('dataset')
+        meta_key1 = 'my_key_%s' % generate_uuid()
+        meta_key2 = 'my_key_%s' % generate_uuid()
+        add_did(scope=mock_scope, name=did_name, did_type='DATASET', account=root_account)
+        set_metadata_bulk(scope=mock_scope, name=did_name, meta={meta_key1: 'value1', meta_key2: 'value2'})
+
+        delete_metadata(scope=mock_scope, name=did_name, key=meta_key1)
+        meta = get_metadata(scope=mock_scope, name=did_name, plugin='JSON')
+        assert meta_key1 not in meta
+        assert meta[meta_key2] == 'value2'
+
+        with pytest.raises(KeyNotFound):
+            delete_metadata(scope=mock_scope, name=did_name, key=meta_key1)
+
     @pytest.mark.dirty
     def test_list_did_meta(self, mock_scope, root_account):
         """ DID Meta (JSON): List did meta """
@@ -191,6 +303,60 @@ class TestDidMetaJSON:
         # assert [{'scope': (tmp_scope), 'name': tmp_dsn4}] == results
         assert [tmp_dsn4] == results
 
+    @pytest.mark.dirty
+    def test_list_did_meta_recursive(self, mock_scope, root_account):
+        """ DID Meta (JSON): List did meta recursively into collections """
+        skip_without_json()
+
+        meta_key = 'my_key_%s' % generate_uuid()
+        meta_value = 'my_value_%s' % generate_uuid()
+
+        tmp_cnt = did_name_generator('container')
+        tmp_dsn1 = did_name_generator('dataset')
+        tmp_dsn2 = did_name_generator('dataset')
+        add_did(scope=mock_scope, name=tmp_cnt, did_type="CONTAINER", account=root_account)
+        add_did(scope=mock_scope, name=tmp_dsn1, did_type="DATASET", account=root_account)
+        add_did(scope=mock_scope, name=tmp_dsn2, did_type="DATASET", account=root_account)
+        attach_dids(scope=mock_scope, name=tmp_cnt, dids=[{'scope': mock_scope, 'name': tmp_dsn1},
+                                                          {'scope': mock_scope, 'name': tmp_dsn2}], account=root_account)
+        set_metadata(scope=mock_scope, name=tmp_cnt, key=meta_key, value=meta_value)
+        set_metadata(scope=mock_scope, name=tmp_dsn1, key=meta_key, value=meta_value)
+        set_metadata(scope=mock_scope, name=tmp_dsn2, key=meta_key, value='other')
+
+        filters = {meta_key: meta_value}
+        assert sorted(list_dids(mock_scope, filters, recursive=True)) == sorted([tmp_cnt, tmp_dsn1])
+        assert filters == {meta_key: meta_value}
+
+    @pytest.mark.dirty
+    def test_list_did_meta_recursive_limit(self, mock_scope, root_account):
+        """ DID Meta (JSON): Limit the recursive listing of several collections """
+        skip_without_json()
+
+        meta_key = 'my_key_%s' % generate_uuid()
+        meta_value = 'my_value_%s' % generate_uuid()
+
+        did_names = []
+        filters = []
+        for _ in range(2):
+            tmp_cnt = did_name_generator('container')
+            tmp_dsns = [did_name_generator('dataset') for _ in range(2)]
+            add_did(scope=mock_scope, name=tmp_cnt, did_type="CONTAINER", account=root_account)
+            for tmp_dsn in tmp_dsns:
+                add_did(scope=mock_scope, name=tmp_dsn, did_type="DATASET", account=root_account)
+            attach_dids(scope=mock_scope, name=tmp_cnt, dids=[{'scope': mock_scope, 'name': tmp_dsn} for tmp_dsn in tmp_dsns],
+                        account=root_account)
+            did_names += [tmp_cnt] + tmp_dsns
+            filters.append({'name': tmp_cnt, meta_key: meta_value})
+        for did_name in did_names:
+            set_metadata(scope=mock_scope, name=did_name, key=meta_key, value=meta_value)
+
+        # search the content of each collection separately
+        with mock.patch('rucio.core.did_meta_plugins.json_meta.chunks', lambda items, _: ([item] for item in items)):
+            assert sorted(list_dids(mock_scope, filters, recursive=True)) == sorted(did_names)
+            results = list(list_dids(mock_scope, filters, recursive=True, limit=3))
+        assert len(results) == 3
+        assert set(results) <= set(did_names)
+
 
 @pytest.fixture(params=["with-auth", "no-auth"])
 def mongo_meta(request):
@@ -285,22 +451,25 @@ class TestDidMetaMongo:
         assert [tmp_dsn4] == results
 
 
+POSTGRES_JSON_META_SETTINGS = {
+    'host': 'postgres',
+    'port': 5433,
+    'db': 'metadata',
+    'user': 'rucio',
+    'password': 'secret',
+    'db_schema': 'public',
+    'table': 'dids',
+    'table_is_managed': True,
+    'table_column_vo': 'vo',
+    'table_column_scope': 'scope',
+    'table_column_name': 'name',
+    'table_column_data': 'data',
+}
+
+
 @pytest.fixture
 def postgres_json_meta():
-    return ExternalPostgresJSONDidMeta(
-        host='postgres',
-        port=5433,
-        db='metadata',
-        user='rucio',
-        password='secret',
-        db_schema='public',
-        table='dids',
-        table_is_managed=True,
-        table_column_vo='vo',
-        table_column_scope='scope',
-        table_column_name='name',
-        table_column_data='data',
-    )
+    return ExternalPostgresJSONDidMeta(**POSTGRES_JSON_META_SETTINGS)
 
 
 @pytest.mark.noparallel(reason='race condition on try-create table')
@@ -318,6 +487,38 @@ class TestDidMetaExternalPostgresJSON:
         postgres_json_meta.set_metadata(scope=mock_scope, name=did_name, key=meta_key, value=meta_value)
         assert postgres_json_meta.get_metadata(scope=mock_scope, name=did_name)[meta_key] == meta_value
 
+    @pytest.mark.dirty
+    def test_delete_metadata(self, mock_scope, root_account, postgres_json_meta):
+        """ DID Meta (POSTGRES_JSON): Delete did meta of a single did """
+        meta_key1 = 'my_key_%s' % generate_uuid()
+        meta_key2 = 'my_key_%s' % generate_uuid()
+        tmp_dsn1 = did_name_generator('dataset')
+        tmp_dsn2 = did_name_generator('dataset')
+        for did_name in [tmp_dsn1, tmp_dsn2]:
+            add_did(scope=mock_scope, name=did_name, did_type="DATASET", account=root_account)
+            postgres_json_meta.set_metadata_bulk(scope=mock_scope, name=did_name, metadata={meta_key1: 'value1', meta_key2: 'value2'})
+
+        postgres_json_meta.delete_metadata(scope=mock_scope, name=tmp_dsn1, key=meta_key1)
+        assert postgres_json_meta.get_metadata(scope=mock_scope, name=tmp_dsn1) == {meta_key2: 'value2'}
+        assert postgres_json_meta.get_metadata(scope=mock_scope, name=tmp_dsn2) == {meta_key1: 'value1', meta_key2: 'value2'}
+
+        with pytest.raises(KeyNotFound):
+            postgres_json_meta.delete_metadata(scope=mock_scope, name=tmp_dsn1, key=meta_key1)
+        with pytest.raises(DataIdentifierNotFound):
+            postgres_json_meta.delete_metadata(scope=mock_scope, name=did_name_generator('dataset'), key=meta_key1)
+
+    @pytest.mark.dirty
+    def test_set_metadata_json_values(self, mock_scope, root_account, postgres_json_meta):
+        """ DID Meta (POSTGRES_JSON): Set values which only the stdlib json module serialises """
+        did_name = did_name_generator('dataset')
+        meta_key1 = 'my_key_%s' % generate_uuid()
+        meta_key2 = 'my_key_%s' % generate_uuid()
+        add_did(scope=mock_scope, name=did_name, did_type='DATASET', account=root_account)
+        postgres_json_meta.set_metadata_bulk(scope=mock_scope, name=did_name, metadata={meta_key1: 2 ** 70, meta_key2: {1: 'one'}})
+        meta = postgres_json_meta.get_metadata(scope=mock_scope, name=did_name)
+        assert meta[meta_key1] == 2 ** 70
+        assert meta[meta_key2] == {'1': 'one'}
+
     @pytest.mark.dirty
     def test_list_did_meta(self, mock_scope, root_account, postgres_json_meta):
         """ DID Meta (POSTGRES_JSON): List did meta """
@@ -376,6 +577,115 @@ class TestDidMetaExternalPostgresJSON:
         # assert [{'scope': (tmp_scope), 'name': tmp_dsn4}] == results
         assert [tmp_dsn4] == results
 
+    @pytest.mark.dirty
+    def test_table_name_resolution(self, mock_scope, root_account):
+        """ DID Meta (POSTGRES_JSON): Resolve schema-qualified and mixed-case table names like unquoted SQL """
+        did_name = did_name_generator('dataset')
+        meta_key = 'my_key_%s' % generate_uuid()
+        meta_value = 'my_value_%s' % generate_uuid()
+        add_did(scope=mock_scope, name=did_name, did_type='DATASET', account=root_account)
+
+        for table in ['public.dids_qualified', 'Dids_Mixed_Case']:
+            postgres_json_meta = ExternalPostgresJSONDidMeta(**dict(POSTGRES_JSON_META_SETTINGS, table=table))
+            postgres_json_meta.set_metadata(scope=mock_scope, name=did_name, key=meta_key, value=meta_value)
+            assert postgres_json_meta.get_metadata(scope=mock_scope, name=did_name)[meta_key] == meta_value
+            with postgres_json_meta._connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT data FROM {} WHERE name=%s;".format(table), (did_name,))
+                assert cur.fetchone()[0][meta_key] == meta_value
+                cur.close()
+            # an externally managed table is verified under the same name
+            ExternalPostgresJSONDidMeta(**dict(POSTGRES_JSON_META_SETTINGS, table=table, table_is_managed=False))
+
+    def test_search_path(self, mock_scope, root_account):
+        """ DID Meta (POSTGRES_JSON): Connect with a search path of several schemas """
+        did_name = did_name_generator('dataset')
+        meta_key = 'my_key_%s' % generate_uuid()
+        add_did(scope=mock_scope, name=did_name, did_type='DATASET', account=root_account)
+
+        postgres_json_meta = ExternalPostgresJSONDidMeta(**dict(POSTGRES_JSON_META_SETTINGS, db_schema='public, pg_catalog'))
+        postgres_json_meta.set_metadata(scope=mock_scope, name=did_name, key=meta_key, value='value')
+        assert postgres_json_meta.get_metadata(scope=mock_scope, name=did_name)[meta_key] == 'value'
+        with postgres_json_meta._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SHOW search_path;")
+            assert cur.fetchone()[0] == 'public, pg_catalog'
+            cur.close()
+
+    @pytest.mark.dirty
+    def test_list_did_meta_numeric_string(self, mock_scope, root_account, postgres_json_meta):
+        """ DID Meta (POSTGRES_JSON): List dids by numeric and string metadata values """
+        meta_key = 'my_key_%s' % generate_uuid()
+        tmp_dsn1 = did_name_generator('dataset')
+        tmp_dsn2 = did_name_generator('dataset')
+        for did_name, value in [(tmp_dsn1, 1), (tmp_dsn2, '1')]:
+            add_did(scope=mock_scope, name=did_name, did_type="DATASET", account=root_account)
+            postgres_json_meta.set_metadata(scope=mock_scope, name=did_name, key=meta_key, value=value)
+
+        # numeric-looking values are cast to numbers, which match numbers and numeric strings alike
+        assert sorted(postgres_json_meta.list_dids(mock_scope, {meta_key: '1'})) == sorted([tmp_dsn1, tmp_dsn2])
+        # values which remain strings are matched by containment, so only match strings
+        assert list(postgres_json_meta.list_dids(mock_scope, {meta_key: "'1'"})) == [tmp_dsn2]
+
+    def test_create_metadata_index(self):
+        """ DID Meta (POSTGRES_JSON): Create the missing metadata index of an existing table on start-up """
+        postgres_json_meta = ExternalPostgresJSONDidMeta(**POSTGRES_JSON_META_SETTINGS)
+        index_name = '%s_data_idx' % POSTGRES_JSON_META_SETTINGS['table']
+        with postgres_json_meta._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DROP INDEX IF EXISTS {};".format(index_name))
+            conn.commit()
+            cur.close()
+
+        postgres_json_meta = ExternalPostgresJSONDidMeta(**POSTGRES_JSON_META_SETTINGS)
+        with postgres_json_meta._connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT to_regclass(%s);", (index_name,))
+            assert cur.fetchone()[0] is not None
+            cur.close()
+
+    @pytest.mark.dirty
+    def test_pool_exhaustion(self, mock_scope, root_account):
+        """ DID Meta (POSTGRES_JSON): Callers wait for a pooled connection rather than fail """
+        postgres_json_meta = ExternalPostgresJSONDidMeta(pool_max_connections=2, pool_timeout=1, **POSTGRES_JSON_META_SETTINGS)
+
+        meta_key = 'my_key_%s' % generate_uuid()
+        did_names = [did_name_generator('dataset') for _ in range(8)]
+        for did_name in did_names:
+            add_did(scope=mock_scope, name=did_name, did_type="DATASET", account=root_account)
+
+        def set_get_metadata(did_name):
+            postgres_json_meta.set_metadata(scope=mock_scope, name=did_name, key=meta_key, value=did_name)
+            return postgres_json_meta.get_metadata(scope=mock_scope, name=did_name)[meta_key]
+
+        with ThreadPoolExecutor(max_workers=len(did_names)) as executor:
+            assert list(executor.map(set_get_metadata, did_names)) == did_names
+
+        # callers queue for a connection up to the pool timeout
+        with postgres_json_meta._connection(), postgres_json_meta._connection():
+            with pytest.raises(DatabaseException):
+                postgres_json_meta.get_metadata(scope=mock_scope, name=did_names[0])
+
+        # unfinished listings don't hold on to a connection
+        listings = [postgres_json_meta.list_dids(mock_scope, {meta_key: did_name}) for did_name in did_names[:3]]
+        assert [next(listing) for listing in listings] == did_names[:3]
+        assert postgres_json_meta.get_metadata(scope=mock_scope, name=did_names[0])[meta_key] == did_names[0]
+
+    def test_list_dids_batches(self, mock_scope, root_account):
+        """ DID Meta (POSTGRES_JSON): List DIDs across several batches, up to the limit """
+        postgres_json_meta = ExternalPostgresJSONDidMeta(**POSTGRES_JSON_META_SETTINGS)
+
+        meta_key = 'my_key_%s' % generate_uuid()
+        did_names = sorted(did_name_generator('dataset') for _ in range(5))
+        for did_name in did_names:
+            add_did(scope=mock_scope, name=did_name, did_type="DATASET", account=root_account)
+            postgres_json_meta.set_metadata(scope=mock_scope, name=did_name, key=meta_key, value='x')
+
+        with mock.patch('rucio.core.did_meta_plugins.postgres_meta.STREAM_BATCH_SIZE', 2):
+            assert sorted(postgres_json_meta.list_dids(mock_scope, {meta_key: 'x'})) == did_names
+            assert len(list(postgres_json_meta.list_dids(mock_scope, {meta_key: 'x'}, limit=3))) == 3
+            assert len(list(postgres_json_meta.list_dids(mock_scope, {meta_key: 'x'}, limit=4))) == 4
+
 
 class TestDidMetaClient:
 
@@ -667,6 +977,26 @@ def test_set_dids_metadata_bulk_multi(did_factory):
             assert testkey in meta and meta[testkey] == testmeta[testkey]
 
 
+def test_set_dids_metadata_bulk_mixed_plugins(did_factory):
+    """ DID (CORE) : Test setting metadata in bulk on multiple dids, across plugins and with a repeated did"""
+    skip_without_json()
+    dids = [did_factory.make_dataset() for _ in range(3)]
+    testkey = 'testkey' + generate_uuid()
+
+    bulk = [{'scope': did['scope'], 'name': did['name'], 'meta': {'project': 'data12_8TeV', testkey: did['name']}} for did in dids]
+    bulk.append({'scope': dids[0]['scope'], 'name': dids[0]['name'], 'meta': {testkey: 'overwritten'}})
+    set_dids_metadata_bulk(dids=bulk, recursive=False)
+
+    for did in dids:
+        meta = get_metadata(plugin="ALL", scope=did['scope'], name=did['name'])
+        assert meta['project'] == 'data12_8TeV'
+        assert meta[testkey] == ('overwritten' if did == dids[0] else did['name'])
+
+    missing = {'scope': dids[0]['scope'], 'name': did_name_generator('dataset'), 'meta': {testkey: 'value'}}
+    with pytest.raises(DataIdentifierNotFound):
+        set_dids_metadata_bulk(dids=[missing], recursive=False)
+
+
 def test_did_set_metadata_bulk_multi_client(testdid):
     """ DID (CLIENT) : Test setting metadata in bulk with multiple key-values """
     skip_without_json()
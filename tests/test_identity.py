@@ -16,6 +16,7 @@ import random
 import string
 
 import pytest
+from sqlalchemy import update
 
 from rucio.common.config import config_get_bool
 from rucio.common.exception import IdentityError, IdentityNotFound
@@ -23,6 +24,7 @@ from rucio.common.types import InternalAccount
 from rucio.common.utils import generate_uuid as uuid
 from rucio.core.account import add_account, del_account
 from rucio.core.identity import add_account_identity, add_identity, del_account_identity, del_identity, list_identities, verify_identity
+from rucio.db.sqla import models
 from rucio.db.sqla.constants import AccountType, IdentityType
 from rucio.tests.common import account_name_generator, auth, hdrdict, headers, rfc2253_dn_generator
 from rucio.tests.common_server import get_vo
@@ -106,6 +108,21 @@ def test_verify_userpass_identity():
     del_account(account)
 
 
+def test_verify_userpass_identity_without_password(db_session):
+    """ Test that a userpass identity without a stored password matches no password. """
+    username = ''.join(random.choice(string.ascii_letters) for i in range(10))
+    password = ''.join(random.choice(string.ascii_letters) for i in range(10))
+    add_identity(username, IdentityType.USERPASS, email=username + '@email.com', password=password)
+    db_session.execute(update(models.Identity).where(models.Identity.identity == username,
+                                                     models.Identity.identity_type == IdentityType.USERPASS).values(password=None))
+    db_session.commit()
+
+    with pytest.raises(IdentityNotFound):
+        verify_identity(username, IdentityType.USERPASS, password=password)
+
+    del_identity(username, IdentityType.USERPASS)
+
+
 def test_verify_x509_identity():
     """ Test if an x509 identity exists in the db, mapped to at least one account. """
     if config_get_bool('common', 'multi_vo', raise_exception=False, default=False):